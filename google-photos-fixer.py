@@ -1,46 +1,146 @@
 #!/usr/bin/env python3
 import os
 import json
+import sys
 import shutil
 import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List, Tuple
+from typing import Deque, Dict, Optional, List, Set, Tuple
+
+# Precompiled patterns used on the hot per-file paths
+# One alternation covering the three filename timestamp styles, so a
+# filename without a timestamp is scanned once instead of three times
+_PAT_TIMESTAMP = re.compile(
+    r'(?P<ymd_hms>\d{8}_\d{6})'
+    r'|(?P<camzoom>\d{17})'
+    r'|(?P<dji>_\d{14}_)'
+)
+_PAT_PHOTOS_FROM = re.compile(r'Photos from (\d{4})/')
+_PAT_SUPPL = re.compile(r'\.suppl\.json$')
+_PAT_SEQ = re.compile(r'(\(\d+\))$')
+_PAT_YEARS_DIR = re.compile(r'Photos from (\d+)$')
+# Every timestamp style above needs a run of at least 8 digits; this
+# cheap gate lets filenames without one skip the alternation entirely
+_PAT_DIGIT_RUN = re.compile(r'\d{8}')
+
+_IMAGE_EXT_SET = frozenset(['.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.mov', '.mp4', '.3gp', '.avi', '.mkv', '.webm'])
+
+# Use orjson when available: it serializes straight to UTF-8 bytes and is
+# several times faster than the stdlib encoder on these small dicts
+try:
+    import orjson
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2).encode('utf-8')
 
 class GooglePhotosFixer:
     METADATA_JSON = "supplemental-metadata.json"
-    SUPPORTED_IMAGE_EXT = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.mov', '.mp4', '.3gp', '.avi', '.mkv', '.webm']
+    SUPPORTED_IMAGE_EXT = _IMAGE_EXT_SET
 
-    def __init__(self, takeout_dir: str):
+    def __init__(self, takeout_dir: str, jobs: Optional[int] = None):
         self.takeout_dir = takeout_dir
-        self.fixes: List[str] = []
-        self.errors: List[str] = []
+        self.jobs = jobs if jobs else min(32, (os.cpu_count() or 4) * 4)
+        self.fixes: Deque[str] = deque()
+        self.errors: Deque[str] = deque()
+        self._dir_index: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
 
     def reset(self):
-        self.fixes = []
-        self.errors = []
+        self.fixes = deque()
+        self.errors = deque()
+        self._dir_index = {}
+
+    def _index_add(self, path: str):
+        directory, name = os.path.split(path)
+        with self._lock:
+            self._dir_index.setdefault(directory, set()).add(name)
+
+    def _index_remove(self, path: str):
+        directory, name = os.path.split(path)
+        with self._lock:
+            names = self._dir_index.get(directory)
+            if names:
+                names.discard(name)
+
+    def _record_fix(self, message: str):
+        # deque.append is atomic under the GIL, so no lock is needed
+        self.fixes.append(message)
+
+    def _record_error(self, message: str):
+        self.errors.append(message)
+
+    def _exists(self, path: str) -> bool:
+        """Answer existence checks from the directory index instead of stat"""
+        directory, name = os.path.split(path)
+        return name in self._dir_index.get(directory, ())
 
     def filename(self, fullpath_filename: str) -> str:
-        return os.path.basename(fullpath_filename)
+        return fullpath_filename.rpartition(os.sep)[2]
 
     def filename_without_ext(self, filename: str) -> str:
-        return os.path.splitext(os.path.basename(filename))[0]
+        name = filename.rpartition(os.sep)[2]
+        return name.rpartition('.')[0] or name
 
     def copy_file(self, origin: str, destination: str):
         shutil.copy2(origin, destination)
-        self.fixes.append(f"{self.filename(origin)} copied to {self.filename(destination)}")
+        self._index_add(destination)
+        self._record_fix(f"{self.filename(origin)} copied to {self.filename(destination)}")
+
+    def _dup_file(self, origin: str, destination: str):
+        """Duplicate a metadata file, hardlinking when the filesystem
+        allows it so no bytes are copied"""
+        try:
+            os.link(origin, destination)
+        except (OSError, NotImplementedError):
+            try:
+                shutil.copy2(origin, destination)
+            except shutil.SameFileError:
+                # Destination is already a hardlink of origin (re-run)
+                return
+        self._index_add(destination)
+        self._record_fix(f"{self.filename(origin)} copied to {self.filename(destination)}")
 
     def move_file(self, origin: str, destination: str):
         shutil.move(origin, destination)
-        self.fixes.append(f"{self.filename(origin)} moved to {self.filename(destination)}")
+        self._index_remove(origin)
+        self._index_add(destination)
+        self._record_fix(f"{self.filename(origin)} moved to {self.filename(destination)}")
 
     def delete_file(self, origin: str):
         os.remove(origin)
-
-    def write_file(self, name: str, content: str):
-        with open(name, 'w') as f:
-            f.write(content)
-        self.fixes.append(f"{self.filename(name)} written")
+        self._index_remove(origin)
+
+    def write_file(self, name: str, content):
+        """Write a small metadata file in one syscall, skipping the
+        text-mode buffering layer"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        fd = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, content)
+        finally:
+            os.close(fd)
+        self._index_add(name)
+        self._record_fix(f"{self.filename(name)} written")
+
+    def _scan(self, path: str):
+        """Recursively yield (directory, file entries) using os.scandir,
+        so names and file types come from the cached DirEntry data"""
+        files = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._scan(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append(entry)
+        yield path, files
 
     def metadata_file_for(self, image_file: str) -> str:
         """Returns the default expected metadata filename"""
@@ -49,82 +149,77 @@ class GooglePhotosFixer:
     def infer_time_from_image_file(self, image_file: str) -> Optional[datetime]:
         """Try to detect the timestamp from file name pattern"""
         filename = self.filename_without_ext(image_file)
-        
-        # Pattern: 20210529_155539
-        match = re.search(r'(\d{4})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})', filename)
-        if match:
-            groups = match.groups()
-            if len(groups) == 6:
-                try:
-                    return datetime(*[int(x) for x in groups])
-                except ValueError:
-                    self.errors.append(f"Invalid date in filename: {image_file}")
-                    return None
-
-        # Pattern: CameraZOOM-20131224200623261
-        match = re.search(r'(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})(\d{3})', filename)
-        if match:
-            groups = match.groups()
-            if len(groups) == 7:
-                try:
-                    return datetime(*[int(x) for x in groups[:6]], int(groups[6]) * 1000)
-                except ValueError:
-                    self.errors.append(f"Invalid date in filename: {image_file}")
-                    return None
-
-        # Pattern: DJI_20250308180700_0070_D
-        match = re.search(r'_(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})_', filename)
+
+        match = _PAT_TIMESTAMP.search(filename) if _PAT_DIGIT_RUN.search(filename) else None
         if match:
-            groups = match.groups()
-            if len(groups) == 6:
-                try:
-                    return datetime(*[int(x) for x in groups])
-                except ValueError:
-                    self.errors.append(f"Invalid date in filename: {image_file}")
-                    return None
+            try:
+                s = match['ymd_hms']
+                if s is not None:
+                    # Pattern: 20210529_155539
+                    return datetime(int(s[0:4]), int(s[4:6]), int(s[6:8]),
+                                    int(s[9:11]), int(s[11:13]), int(s[13:15]))
+                s = match['camzoom']
+                if s is not None:
+                    # Pattern: CameraZOOM-20131224200623261
+                    return datetime(int(s[0:4]), int(s[4:6]), int(s[6:8]),
+                                    int(s[8:10]), int(s[10:12]), int(s[12:14]),
+                                    int(s[14:17]) * 1000)
+                s = match['dji']
+                # Pattern: DJI_20250308180700_0070_D
+                return datetime(int(s[1:5]), int(s[5:7]), int(s[7:9]),
+                                int(s[9:11]), int(s[11:13]), int(s[13:15]))
+            except ValueError:
+                self._record_error(f"Invalid date in filename: {image_file}")
+                return None
 
         # Pattern: Photos from 2024/P01020304.jpg
-        match = re.search(r'Photos from (\d{4})/', image_file)
-        if match:
-            groups = match.groups()
-            if len(groups) == 1:
-                return datetime(int(groups[0]), 1, 1)
+        if 'Photos from ' in image_file:
+            match = _PAT_PHOTOS_FROM.search(image_file)
+            if match:
+                return datetime(int(match.group(1)), 1, 1)
 
         return None
 
     def generate_metadata_for_image_file(self, image_file: str):
         """Fallback to generate a metadata filename based on filename pattern"""
-        metadata_filename = self.metadata_file_for(image_file)
-        if os.path.exists(metadata_filename):
+        directory, name = os.path.split(image_file)
+        metadata_name = f"{name}.{self.METADATA_JSON}"
+        # Metadata present on disk was collected by the initial scan and
+        # anything created this run is added by write/copy/move, so the
+        # already-generated check never leaves memory
+        if metadata_name in self._dir_index.get(directory, ()):
             return
 
         filename = self.filename_without_ext(image_file)
         time = self.infer_time_from_image_file(image_file)
         
         if time:
+            # Both time entries share the same values, so convert once
+            timestamp = str(int(time.timestamp()))
+            formatted = str(time)
             json_content = {
                 "title": self.filename(image_file),
                 "description": f"Metadata inferred from {filename}",
                 "imageViews": "1",
                 "creationTime": {
-                    "timestamp": str(int(time.timestamp())),
-                    "formatted": str(time)
+                    "timestamp": timestamp,
+                    "formatted": formatted
                 },
                 "photoTakenTime": {
-                    "timestamp": str(int(time.timestamp())),
-                    "formatted": str(time)
+                    "timestamp": timestamp,
+                    "formatted": formatted
                 }
             }
-            self.write_file(metadata_filename, json.dumps(json_content, indent=2))
+            self.write_file(os.path.join(directory, metadata_name), _json_dumps(json_content))
         else:
-            self.errors.append(f"Unable to infer metadata for {image_file}")
+            self._record_error(f"Unable to infer metadata for {image_file}")
 
     def fix_divergent_metadata_filename(self, json_file: str) -> str:
         """Normalize truncated json metadata filenames"""
         if not json_file.endswith(self.METADATA_JSON):
             parts = json_file.split('.')
             # Reconstruct with proper metadata filename
-            fixed_json_file = re.sub(r'\.suppl\.json$', f'.{self.METADATA_JSON}', json_file)
+            fixed_json_file = _PAT_SUPPL.sub(f'.{self.METADATA_JSON}', json_file)
             if fixed_json_file != json_file:
                 self.move_file(json_file, fixed_json_file)
                 json_file = fixed_json_file
@@ -133,89 +228,123 @@ class GooglePhotosFixer:
 
     def fix_metadata_file_for_image(self, image_file: str) -> str:
         """Fix metadata files for various image naming patterns"""
+        # The vast majority of images carry neither marker; two substring
+        # scans skip all the path splitting and regex work below
+        if "-editada" not in image_file and "(" not in image_file:
+            return image_file
+
         # Create metadata for "-editada" version
         if "-editada" in image_file:
             original_file = image_file.replace("-editada", "")
             original_meta = f"{original_file}.{self.METADATA_JSON}"
 
-            if os.path.exists(original_meta):
+            if self._exists(original_meta):
                 edited_meta = f"{image_file}.{self.METADATA_JSON}"
-                self.copy_file(original_meta, edited_meta)
+                self._dup_file(original_meta, edited_meta)
 
         # Fix metadata filenames for sequential images
         # Pattern: 20210529_155539(1).jpg
-        filename_no_ext = self.filename_without_ext(image_file)
-        match = re.search(r'(\(\d+\))$', filename_no_ext)
-        
+        dir_path, _, base = image_file.rpartition(os.sep)
+        stem = base.rpartition('.')[0] or base
+        match = _PAT_SEQ.search(stem)
+
         if match:
             num = match.group(1)
-            filename_without_num = self.filename(image_file).replace(num, "")
-            # Remove extension from filename_without_num
-            filename_without_num = filename_without_num.rsplit('.', 1)[0] + '.' + filename_without_num.rsplit('.', 1)[1]
-            dir_path = os.path.dirname(image_file)
+            base_without_num = base.replace(num, "")
 
-            wrong_json_file = os.path.join(dir_path, f"{filename_without_num}.supplemental-metadata{num}.json")
-            fixed_json_file = os.path.join(dir_path, f"{self.filename(image_file)}.{self.METADATA_JSON}")
+            wrong_json_file = os.path.join(dir_path, f"{base_without_num}.supplemental-metadata{num}.json")
+            fixed_json_file = os.path.join(dir_path, f"{base}.{self.METADATA_JSON}")
             
-            if os.path.exists(wrong_json_file):
-                if os.path.exists(fixed_json_file):
-                    self.errors.append(f"Metadata file already exist: {fixed_json_file}")
+            if self._exists(wrong_json_file):
+                if self._exists(fixed_json_file):
+                    self._record_error(f"Metadata file already exist: {fixed_json_file}")
                 else:
                     self.move_file(wrong_json_file, fixed_json_file)
             else:
-                self.errors.append(f"Metadata file: {wrong_json_file} not exist for image: {image_file}")
+                self._record_error(f"Metadata file: {wrong_json_file} not exist for image: {image_file}")
 
         return image_file
 
-    def execute(self):
-        self.reset()
+    def _report(self, header: str, items):
+        """Emit a numbered report in one buffered write instead of a
+        print per line"""
+        if not items:
+            return
+        total = len(items)
+        lines = [header]
+        lines.extend(f"[{index}/{total}] {item}" for index, item in enumerate(items, 1))
+        lines.append("")
+        sys.stdout.write("\n".join(lines))
 
-        all_files = []
-        for root, dirs, files in os.walk(self.takeout_dir):
-            for file in files:
-                all_files.append(os.path.join(root, file))
-        
-        print(f"Total files found on {self.takeout_dir}: {len(all_files)}")
+    def _process_one(self, image_file: str):
+        self.fix_metadata_file_for_image(image_file)
+        self.generate_metadata_for_image_file(image_file)
 
-        years_files = [f for f in all_files if re.search(r'Photos from (\d+)$', os.path.dirname(f))]
-        print(f"Total photos from YYYY dirs found: {len(years_files)}")
+    def execute(self):
+        self.reset()
 
-        image_files = [f for f in years_files if os.path.splitext(f)[1].lower() in self.SUPPORTED_IMAGE_EXT]
+        all_files_count = 0
+        years_files_count = 0
+        image_files = []
+        json_files = []
+        # Classify every file in a single scandir pass; the "Photos from
+        # YYYY" check only depends on the directory, so test it once per dir
+        for root, entries in self._scan(self.takeout_dir):
+            all_files_count += len(entries)
+            self._dir_index[root] = {entry.name for entry in entries}
+            if 'Photos from ' not in root or not _PAT_YEARS_DIR.search(root):
+                continue
+            years_files_count += len(entries)
+            for entry in entries:
+                name = entry.name
+                ext = name[name.rfind('.'):].lower()
+                if ext in _IMAGE_EXT_SET:
+                    image_files.append(entry.path)
+                elif ext == '.json':
+                    json_files.append(entry.path)
+
+        print(f"Total files found on {self.takeout_dir}: {all_files_count}")
+        print(f"Total photos from YYYY dirs found: {years_files_count}")
         print(f"Total supported photos formats found: {len(image_files)}")
-
-        json_files = [f for f in years_files if os.path.splitext(f)[1].lower() == '.json']
         print(f"Total metadata files found: {len(json_files)}")
 
         json_files = [self.fix_divergent_metadata_filename(jf) for jf in json_files]
 
-        for img in image_files:
-            self.fix_metadata_file_for_image(img)
-            self.generate_metadata_for_image_file(img)
-
-        if len(self.errors) > 0:
-            print(f"\nProcess finalized with {len(self.errors)} errors:")
-            for index, error in enumerate(self.errors, 1):
-                print(f"[{index}/{len(self.errors)}] {error}")
+        # Each image is independent and the work is syscall-bound, so
+        # overlap the filesystem latency across worker threads
+        if self.jobs > 1 and len(image_files) > 1:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                list(executor.map(self._process_one, image_files))
+        else:
+            for img in image_files:
+                self._process_one(img)
 
-        if len(self.fixes) > 0:
-            print(f"\nProcess finalized with {len(self.fixes)} fixes:")
-            for index, fix in enumerate(self.fixes, 1):
-                print(f"[{index}/{len(self.fixes)}] {fix}")
+        self._report(f"\nProcess finalized with {len(self.errors)} errors:", self.errors)
+        self._report(f"\nProcess finalized with {len(self.fixes)} fixes:", self.fixes)
 
-        not_found = [img for img in image_files if not os.path.exists(self.metadata_file_for(img))]
+        # The index already reflects every metadata file created above,
+        # so this pass never touches the disk
+        meta_suffix = f".{self.METADATA_JSON}"
+        not_found = []
+        for img in image_files:
+            directory, name = os.path.split(img)
+            if name + meta_suffix not in self._dir_index.get(directory, ()):
+                not_found.append(img)
 
-        if len(not_found) > 0:
-            print(f"\nMetadata not found for {len(not_found)} files:")
-            for index, file in enumerate(not_found, 1):
-                print(f"[{index}/{len(not_found)}] {file}")
+        self._report(f"\nMetadata not found for {len(not_found)} files:", not_found)
 
 
 if __name__ == "__main__":
-    import sys
-    
-    if len(sys.argv) < 2:
-        raise ValueError("Usage: python fix_metadata.py path/to/takeout/dir/")
+    args = sys.argv[1:]
+    jobs = None
+    for arg in list(args):
+        if arg.startswith("--jobs="):
+            jobs = int(arg.split("=", 1)[1])
+            args.remove(arg)
+
+    if len(args) < 1:
+        raise ValueError("Usage: python fix_metadata.py [--jobs=N] path/to/takeout/dir/")
     
-    takeout_dir = sys.argv[1]
-    fixer = GooglePhotosFixer(takeout_dir)
+    takeout_dir = args[0]
+    fixer = GooglePhotosFixer(takeout_dir, jobs=jobs)
     fixer.execute()